@@ -1,11 +1,22 @@
 
 import base64
+import contextlib
+import csv
+import io
 import os
 import pathlib
+import shutil
+import tarfile
+import time
 import typing
+import zipfile
 
 import pandas as pd
 
+IMAGE_ARCHIVE_FORMATS = ('zip', 'tar')
+
+IMAGE_ARCHIVE_INDEX_COLUMNS = ['column', 'member']
+
 
 def process_image(image_str: str, pth: str | pathlib.Path) -> None:
     """
@@ -50,20 +61,46 @@ def save_base64_image(fname: str | pathlib.Path, image_format: str, image_data:
     :param image_data: Image data.
     :return: None
     """
-    with open(f"{fname}.{image_format}", "wb") as fh:
-        fh.write(image_data)
+    with atomic_output_path(f"{fname}.{image_format}") as tmp_pth:
+        with open(tmp_pth, "wb") as fh:
+            fh.write(image_data)
+
+
+@contextlib.contextmanager
+def atomic_output_path(pth: str | pathlib.Path) -> typing.Iterator[str]:
+    """
+    Yield a temporary path to write an output to, which is renamed to the given path once the writing is complete.
+    If the writing is interrupted, the temporary file is removed and any previous file at the given path is kept.
+
+    :param pth: The final path of the output.
+    :return: The temporary path to write to.
+    """
+    tmp_pth = f"{pth}.tmp"
+    try:
+        yield tmp_pth
+    except BaseException:
+        if os.path.exists(tmp_pth):
+            os.remove(tmp_pth)
+        raise
+    os.replace(tmp_pth, pth)
 
 
 def save_image_columns(df: pd.DataFrame, survey_name: str, root: str | pathlib.Path = '.',
-                       grouper: str = 'sessionToken') -> None:
+                       grouper: str = 'sessionToken', archive_format: str | None = None) -> None:
     """
     Save image columns from a dataframe to a directory.
     :param df: The dataframe containing the image columns as base64 strings.
     :param survey_name: Name of the survey.
     :param root: Root directory to save the images to.
     :param grouper: The column to group the images by.
+    :param archive_format: If 'zip' or 'tar', the images are written into a single archive per
+        survey (see `save_image_columns_to_archive`) rather than a file per image. Default is None.
     :return:
     """
+    if archive_format is not None:
+        save_image_columns_to_archive(df, survey_name, archive_format, root=root, grouper=grouper)
+        return
+
     image_columns = find_image_columns(df)
 
     if len(image_columns):
@@ -76,3 +113,169 @@ def save_image_columns(df: pd.DataFrame, survey_name: str, root: str | pathlib.P
                 os.makedirs(pth, exist_ok=True)
                 process_image(g[i].values[0],
                               os.path.join(pth, n))
+
+
+def save_image_columns_to_archive(df: pd.DataFrame, survey_name: str, archive_format: str = 'zip',
+                                  root: str | pathlib.Path = '.', grouper: str = 'sessionToken') -> str | None:
+    """
+    Save image columns from a dataframe into a single, uncompressed, archive per survey.
+
+    The images are decoded and written straight into
+    `<root>/pavlovia-survey-utils/<survey_name>/images.<archive_format>`, as `<column>/<grouper value>.<format>`
+    members. PNG/JPEG data is already compressed, so members are stored as-is. An index mapping each
+    grouper value and column to its archive member is kept next to the archive (`images.csv`).
+
+    If the archive already exists, new images are appended to it in place, and images already listed in the index
+    are skipped. The index is the record of the archive contents - it is replaced (atomically) only after all images
+    were written. Before appending, the archive bytes which are going to be overwritten (the zip central directory,
+    or the tar end-of-archive blocks) are saved next to the archive (`images.<archive_format>.rollback`). If a run
+    does not complete, even if the process is killed, the archive is restored from them when it is next opened.
+
+    :param df: The dataframe containing the image columns as base64 strings.
+    :param survey_name: Name of the survey.
+    :param archive_format: Format of the archive, either 'zip' or 'tar'.
+    :param root: Root directory to save the archive to.
+    :param grouper: The column to group the images by.
+    :return: The path to the archive, or None if there are no image columns.
+    """
+    if archive_format not in IMAGE_ARCHIVE_FORMATS:
+        raise ValueError(f"Invalid archive format: {archive_format}.")
+
+    image_columns = find_image_columns(df)
+
+    if not len(image_columns):
+        return None
+
+    pth = os.path.join(os.path.abspath(root), 'pavlovia-survey-utils', survey_name)
+    os.makedirs(pth, exist_ok=True)
+    archive_path = os.path.join(pth, f'images.{archive_format}')
+    index_path = os.path.join(pth, 'images.csv')
+    rollback_path = f'{archive_path}.rollback'
+
+    # Undo the leftovers of a previous run which did not complete.
+    _rollback_image_archive(archive_path, rollback_path, index_path)
+
+    index_exists = os.path.exists(index_path)
+    existing_members = set()
+    if index_exists:
+        with open(index_path, 'r', newline='', encoding='utf-8') as index_file:
+            existing_members = {row[-1] for row in list(csv.reader(index_file))[1:]}
+
+    try:
+        # The archive is closed before the index is renamed, so the index only lists fully written members.
+        with atomic_output_path(index_path) as tmp_index_path:
+            if index_exists:
+                shutil.copyfile(index_path, tmp_index_path)
+            else:
+                open(tmp_index_path, 'w').close()
+
+            with _open_image_archive(archive_path, archive_format, rollback_path, index_path) as add_member, \
+                    open(tmp_index_path, 'a', newline='', encoding='utf-8') as index_file:
+                index_writer = csv.writer(index_file)
+                if not index_exists:
+                    index_writer.writerow([grouper] + IMAGE_ARCHIVE_INDEX_COLUMNS)
+
+                for n, g in df.groupby(grouper):
+                    for i in image_columns:
+                        image_format, image_data = read_base64_image_str(g[i].values[0])
+                        member = f'{i}/{n}.{image_format}'
+                        if member in existing_members:
+                            continue
+                        add_member(member, image_data)
+                        existing_members.add(member)
+                        index_writer.writerow([n, i, member])
+    except BaseException:
+        _rollback_image_archive(archive_path, rollback_path, index_path)
+        raise
+
+    os.remove(rollback_path)
+    return archive_path
+
+
+@contextlib.contextmanager
+def _open_image_archive(archive_path: str, archive_format: str, rollback_path: str,
+                        index_path: str) -> typing.Iterator[typing.Callable[[str, bytes], None]]:
+    """
+    Open a zip or tar archive for appending in place. Before anything is written, the position new members are
+    appended at, the archive bytes from that position onwards (only the archive metadata), and the size of the index
+    are saved to the rollback file (see `_rollback_image_archive`).
+
+    :param archive_path: Path to the archive. Created if it does not exist.
+    :param archive_format: Format of the archive, either 'zip' or 'tar'.
+    :param rollback_path: Path to the rollback file.
+    :param index_path: Path to the index of the archive.
+    :return: A function adding a member given its name and data.
+    """
+    index_size = os.path.getsize(index_path) if os.path.exists(index_path) else 0
+
+    if not os.path.exists(archive_path):
+        # An offset of -1 marks an archive created by this run.
+        _write_image_archive_rollback(rollback_path, -1, index_size, b'')
+
+    if archive_format == 'zip':
+        archive = zipfile.ZipFile(archive_path, 'a', compression=zipfile.ZIP_STORED)
+        # New members overwrite the central directory, which is rewritten on close.
+        append_offset = archive.start_dir
+        add_member = archive.writestr
+    else:
+        archive = tarfile.open(archive_path, 'a')
+        # New members overwrite the end-of-archive blocks.
+        append_offset = archive.offset
+
+        def add_member(name: str, data: bytes) -> None:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            archive.addfile(info, io.BytesIO(data))
+
+    with archive:
+        if not os.path.exists(rollback_path):
+            with open(archive_path, 'rb') as f:
+                f.seek(append_offset)
+                _write_image_archive_rollback(rollback_path, append_offset, index_size, f.read())
+        yield add_member
+
+
+def _write_image_archive_rollback(rollback_path: str, append_offset: int, index_size: int, tail: bytes) -> None:
+    """
+    Write the rollback file of an archive, as a header line with the append offset and index size, followed by the
+    archive bytes from the append offset onwards.
+    """
+    with atomic_output_path(rollback_path) as tmp_pth:
+        with open(tmp_pth, 'wb') as f:
+            f.write(f'{append_offset} {index_size}\n'.encode())
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _rollback_image_archive(archive_path: str, rollback_path: str, index_path: str) -> None:
+    """
+    Restore an archive to its state before a run which did not complete, using its rollback file. If the index was
+    already committed by that run, the archive is complete and only the rollback file is removed.
+
+    :param archive_path: Path to the archive.
+    :param rollback_path: Path to the rollback file. Nothing is done if it does not exist.
+    :param index_path: Path to the index of the archive.
+    :return: None
+    """
+    if not os.path.exists(rollback_path):
+        return
+
+    with open(rollback_path, 'rb') as f:
+        append_offset, index_size = (int(i) for i in f.readline().split())
+        tail = f.read()
+
+    # The index is only appended to, so a different size means it was replaced by the run.
+    committed = (os.path.getsize(index_path) if os.path.exists(index_path) else 0) != index_size
+
+    if not committed and os.path.exists(archive_path):
+        if append_offset < 0:
+            os.remove(archive_path)
+        else:
+            with open(archive_path, 'r+b') as f:
+                f.truncate(append_offset)
+                f.seek(append_offset)
+                f.write(tail)
+
+    os.remove(rollback_path)
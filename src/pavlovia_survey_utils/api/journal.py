@@ -0,0 +1,120 @@
+"""
+This module includes functions related to the job journal, recording which stages of a bulk download were completed
+for each survey, so that an interrupted download can be resumed.
+"""
+
+import json
+import os
+import pathlib
+import typing
+
+from . import file_utils
+
+JOURNAL_FNAME = 'journal.json'
+
+STAGE_FETCHED = 'fetched'
+STAGE_FLATTENED = 'flattened'
+STAGE_CSV_WRITTEN = 'csv_written'
+STAGE_IMAGES_WRITTEN = 'images_written'
+
+STAGES = [STAGE_FETCHED, STAGE_FLATTENED, STAGE_CSV_WRITTEN, STAGE_IMAGES_WRITTEN]
+
+STAGES_KEY_NAME = 'stages'
+OPTIONS_KEY_NAME = 'options'
+
+
+def get_journal_path(root: str | pathlib.Path) -> str:
+    """
+    Return the path to the job journal under the given output root.
+
+    :param root: The root directory the surveys are saved to.
+    :return: str: The path to the journal file.
+    """
+    return os.path.join(os.path.abspath(root), 'pavlovia-survey-utils', JOURNAL_FNAME)
+
+
+def load_journal(root: str | pathlib.Path) -> dict:
+    """
+    Load the job journal, as a dictionary where keys are the survey ids and values are dictionaries holding the
+    options the survey was saved with, and the list of its completed stages.
+
+    :param root: The root directory the surveys are saved to.
+    :return: dict: The journal. Returns empty if no journal exists.
+    """
+    pth = get_journal_path(root)
+
+    if not os.path.exists(pth):
+        return dict()
+
+    with open(pth, 'r') as f:
+        return json.load(f)
+
+
+def save_journal(journal: dict, root: str | pathlib.Path) -> None:
+    """
+    Save the job journal. The previous journal is only replaced once the new one is fully written.
+
+    :param journal: The journal.
+    :param root: The root directory the surveys are saved to.
+    :return: None
+    """
+    pth = get_journal_path(root)
+    os.makedirs(os.path.dirname(pth), exist_ok=True)
+
+    with file_utils.atomic_output_path(pth) as tmp_pth:
+        with open(tmp_pth, 'w') as f:
+            json.dump(journal, f)
+
+
+def reset_survey(journal: dict, survey_id: str, options: dict | None = None) -> None:
+    """
+    Clear the completed stages of a survey, and record the options it is going to be saved with. The journal is
+    not saved - call `save_journal` once all surveys were reset.
+
+    :param journal: The journal.
+    :param survey_id: The survey id.
+    :param options: The options the survey is saved with (e.g., the image archive format). Must be JSON serializable.
+    :return: None
+    """
+    journal[survey_id] = {OPTIONS_KEY_NAME: options, STAGES_KEY_NAME: []}
+
+
+def mark_stage_complete(journal: dict, root: str | pathlib.Path, survey_id: str, stage: str) -> None:
+    """
+    Record a completed stage of a survey, and save the journal.
+
+    :param journal: The journal.
+    :param root: The root directory the surveys are saved to.
+    :param survey_id: The survey id.
+    :param stage: The completed stage, one of `STAGES`.
+    :return: None
+    """
+    if stage not in STAGES:
+        raise ValueError(f"Invalid stage: {stage}.")
+
+    stages = journal.setdefault(survey_id, {OPTIONS_KEY_NAME: None, STAGES_KEY_NAME: []})[STAGES_KEY_NAME]
+    if stage not in stages:
+        stages.append(stage)
+    save_journal(journal, root)
+
+
+def is_stage_complete(journal: dict, survey_id: str, stage: str) -> bool:
+    """Return whether the given stage was completed for the survey."""
+    return stage in journal.get(survey_id, {}).get(STAGES_KEY_NAME, [])
+
+
+def has_same_options(journal: dict, survey_id: str, options: dict | None) -> bool:
+    """Return whether the survey was recorded with the given options."""
+    return survey_id in journal and journal[survey_id].get(OPTIONS_KEY_NAME) == options
+
+
+def is_survey_complete(journal: dict, survey_id: str) -> bool:
+    """Return whether all stages were completed for the survey."""
+    return all(is_stage_complete(journal, survey_id, stage) for stage in STAGES)
+
+
+def get_incomplete_surveys(journal: dict, survey_ids: typing.Sequence[str],
+                           options: dict | None = None) -> typing.List[str]:
+    """Return the survey ids, out of the given ones, which were not completed with the given options."""
+    return [_id for _id in survey_ids
+            if not (is_survey_complete(journal, _id) and has_same_options(journal, _id, options))]
@@ -1,41 +1,152 @@
+import fnmatch
 import json
 import os
 import pathlib
+import re
 import typing
 import warnings
 
 import pandas as pd
 import requests
 
-from . import file_utils
+from . import file_utils, journal
 
 COLUMN_NAME_SURVEY_NAME = 'surveyName'
 
 COLUMN_NAME_SURVEY_RESPONSE = 'surveyResponse'
 
+COLUMN_NAME_SESSION_TOKEN = 'sessionToken'
+
+COLUMN_NAME_SURVEY_ID = 'surveyId'
+
+# Columns of the long-format (response, item, value) dataset.
+DATASET_COLUMNS = [COLUMN_NAME_SURVEY_ID, COLUMN_NAME_SURVEY_NAME, 'response', 'item', 'value']
+
+DATASET_PARTITION_FNAME = 'responses.csv'
+
+# Prefix marking a column selection pattern as a regular expression, rather than a glob.
+COLUMNS_REGEX_PREFIX = 're:'
+
+ColumnsSelection = typing.Union[str, re.Pattern, typing.Sequence[typing.Union[str, re.Pattern]]]
+
 SURVEYS_URL = 'https://pavlovia.org/api/v2/surveys'
 
 __all__ = ['load_available_surveys', 'download_surveys', 'get_surveys_dataframe', 'get_surveys_raw',
-           'download_surveys_as_json']
+           'download_surveys_as_json', 'download_surveys_as_dataset']
 
 
 def download_surveys(token: str, survey_ids: str | typing.Sequence[str] | None = None,
-                     root: typing.Union[str, pathlib.Path] = '.'):
+                     root: typing.Union[str, pathlib.Path] = '.', image_archive: str | None = None,
+                     resume: bool = False, columns: ColumnsSelection | None = None):
+    """
+    Download surveys and save each of them as a csv file and possibly images.
+
+    Surveys are processed one at a time, and the completed stages of each survey (fetched, flattened, csv written,
+    images written) are recorded in a job journal under the root directory (see `journal.get_journal_path`).
+    Outputs are written to temporary paths and renamed once complete, so an interrupted download does not leave
+    half-written files.
+
+    :param token: The Pavlovia token.
+    :param survey_ids: A survey id or a list of survey ids. If None, all available surveys are downloaded.
+    :param root: The root directory to save the surveys under.
+    :param image_archive: If 'zip' or 'tar', save the images of each survey into a single archive rather than a
+        file per image. Default is None.
+    :param resume: If True, skip surveys which were completed by a previous run, and only redo the incomplete
+        stages of the rest. Surveys saved by a previous run with a different `image_archive` or `columns` are
+        downloaded again from scratch. Default is False.
+    :param columns: The survey response fields to keep (see `extract_dataframes_from_raw_survey`). If None, all
+        fields are kept.
+    :return: None
+    """
+    if image_archive is not None and image_archive not in file_utils.IMAGE_ARCHIVE_FORMATS:
+        raise ValueError(f"Invalid image archive format: {image_archive}.")
+
     abs_root = os.path.abspath(root)
 
     if survey_ids is None:
         survey_ids = list(load_available_surveys(token).keys())
+    elif isinstance(survey_ids, str):
+        survey_ids = [survey_ids]
+
+    options = {'image_archive': image_archive, 'columns': _columns_selection_to_json(columns)}
+    job_journal = journal.load_journal(abs_root)
+
+    if resume:
+        survey_ids = journal.get_incomplete_surveys(job_journal, survey_ids, options)
+
+    # Surveys which are not resumed are saved from scratch. The journal is saved before any download, so a survey
+    # failing in this run is not left marked as complete by a previous run.
+    for _id in survey_ids:
+        if not (resume and journal.has_same_options(job_journal, _id, options)):
+            if resume and _id in job_journal:
+                warnings.warn(f"Survey {_id} was saved with different options, downloading it again.")
+            journal.reset_survey(job_journal, _id, options)
+    journal.save_journal(job_journal, abs_root)
 
-    surveys_dfs = get_surveys_dataframe(survey_ids, token)
+    for _id in survey_ids:
+        raw_survey = _download_survey(_id, token)
+        if not raw_survey:
+            continue
+        journal.mark_stage_complete(job_journal, abs_root, _id, journal.STAGE_FETCHED)
 
-    for _id in surveys_dfs.keys():
-        if not surveys_dfs[_id].empty:
+        df = extract_dataframes_from_raw_survey(raw_survey, columns=columns)
+        del raw_survey
+        journal.mark_stage_complete(job_journal, abs_root, _id, journal.STAGE_FLATTENED)
+
+        if not df.empty:
             _save_survey_as_directory(
-                surveys_dfs[_id], surveys_dfs[_id]['surveyName'].iloc[0],
-                root=abs_root
+                df, df[COLUMN_NAME_SURVEY_NAME].iloc[0],
+                root=abs_root, image_archive=image_archive,
+                survey_id=_id, job_journal=job_journal
             )
         else:
             warnings.warn(f"No data found for survey {_id}.")
+            # Nothing to write, the survey is complete.
+            journal.mark_stage_complete(job_journal, abs_root, _id, journal.STAGE_CSV_WRITTEN)
+            journal.mark_stage_complete(job_journal, abs_root, _id, journal.STAGE_IMAGES_WRITTEN)
+
+
+def download_surveys_as_dataset(token: str, survey_ids: str | typing.Sequence[str] | None = None,
+                                root: typing.Union[str, pathlib.Path] = '.',
+                                dataset_name: str = 'pavlovia-surveys-dataset',
+                                columns: ColumnsSelection | None = None) -> str:
+    """
+    Download surveys into a single long-format dataset, partitioned by survey id.
+
+    Each survey is downloaded, flattened and written to its own partition
+    (`<root>/<dataset_name>/surveyId=<survey id>/responses.csv`) before the next one is
+    fetched, so only a single survey is held in memory at any time. All partitions share the
+    same columns (surveyId, surveyName, response, item, value), and can be read back together
+    without re-aligning columns. Rows are built straight from the survey responses, with a row per
+    answered item only. Images are not included in the dataset.
+
+    :param token: The Pavlovia token.
+    :param survey_ids: A survey id or a list of survey ids. If None, all available surveys are downloaded.
+    :param root: The root directory to save the dataset under.
+    :param dataset_name: The name of the dataset directory.
+    :param columns: The survey response fields to keep (see `extract_dataframes_from_raw_survey`). If None, all
+        fields are kept.
+    :return: str: The path to the dataset directory.
+    """
+    dataset_path = os.path.join(os.path.abspath(root), dataset_name)
+
+    if survey_ids is None:
+        survey_ids = list(load_available_surveys(token).keys())
+    elif isinstance(survey_ids, str):
+        survey_ids = [survey_ids]
+
+    for _id in survey_ids:
+        raw_survey = _download_survey(_id, token)
+        if not raw_survey:
+            continue
+
+        if not raw_survey['survey_responses']:
+            warnings.warn(f"No data found for survey {_id}.")
+            continue
+
+        _save_dataset_partition(_long_format_from_raw_survey(raw_survey, _id, columns=columns), _id, dataset_path)
+
+    return dataset_path
 
 
 def download_surveys_as_json(survey_id: str, token: str, survey_name: str, root='.') -> None:
@@ -79,12 +190,15 @@ def load_available_surveys(token: str, access_rights: str = 'both') -> dict:
         resp.raise_for_status()
 
 
-def get_surveys_dataframe(survey_ids: str | typing.Sequence[str], token: str) -> dict:
+def get_surveys_dataframe(survey_ids: str | typing.Sequence[str], token: str,
+                          columns: ColumnsSelection | None = None) -> dict:
     """
     Gets a dict of survey dataframes for the given survey ids and token.
 
     :param survey_ids: A list of survey ids.
     :param token: The Pavlovia token.
+    :param columns: The survey response fields to keep (see `extract_dataframes_from_raw_survey`). If None, all
+        fields are kept.
     :return: A dict of survey dataframes.
     """
     if isinstance(survey_ids, str):
@@ -92,7 +206,7 @@ def get_surveys_dataframe(survey_ids: str | typing.Sequence[str], token: str) ->
 
     raw_surveys = get_surveys_raw(survey_ids, token)
 
-    return {_id: extract_dataframes_from_raw_survey(raw_surveys[_id]) for _id in survey_ids}
+    return {_id: extract_dataframes_from_raw_survey(raw_surveys[_id], columns=columns) for _id in survey_ids}
 
 
 def get_surveys_raw(survey_ids: str | typing.Sequence[str], token: str) -> dict:
@@ -111,7 +225,8 @@ def get_surveys_raw(survey_ids: str | typing.Sequence[str], token: str) -> dict:
 
 def _save_survey_as_directory(df: pd.DataFrame, survey_name: str,
                               root: typing.Union[str, pathlib.Path] = '.',
-                              save_images: bool = True, ) -> None:
+                              save_images: bool = True, image_archive: str | None = None,
+                              survey_id: str | None = None, job_journal: dict | None = None) -> None:
     """
     Saves the survey data as a directory containing a csv file and possibly images.
 
@@ -119,14 +234,30 @@ def _save_survey_as_directory(df: pd.DataFrame, survey_name: str,
     :param survey_name (str): The name of the survey.
     :param root: (str, pathlib.Path): The root directory to save the survey data.
     :param save_images (bool): Whether to save images or not. Default is True.
+    :param image_archive (str): If 'zip' or 'tar', save the images into a single archive rather than a file per
+        image. Default is None.
+    :param survey_id (str): The survey id, used to record the completed stages in the job journal.
+    :param job_journal (dict): The job journal. If provided, stages already completed are skipped, and newly
+        completed stages are recorded. Default is None.
     :return: None
     """
+    if job_journal is None:
+        job_journal = dict()
+
+    def _complete_stage(stage):
+        if survey_id is not None:
+            journal.mark_stage_complete(job_journal, root, survey_id, stage)
+
     image_columns = file_utils.find_image_columns(df)
 
-    _save_csv(df.drop(image_columns, axis=1), survey_name, root)
+    if not journal.is_stage_complete(job_journal, survey_id, journal.STAGE_CSV_WRITTEN):
+        _save_csv(df.drop(image_columns, axis=1), survey_name, root)
+        _complete_stage(journal.STAGE_CSV_WRITTEN)
 
-    if save_images and len(image_columns):
-        file_utils.save_image_columns(df, survey_name, root=root)
+    if not journal.is_stage_complete(job_journal, survey_id, journal.STAGE_IMAGES_WRITTEN):
+        if save_images and len(image_columns):
+            file_utils.save_image_columns(df, survey_name, root=root, archive_format=image_archive)
+        _complete_stage(journal.STAGE_IMAGES_WRITTEN)
 
 
 def _download_survey(survey_id: str, token: str) -> dict:
@@ -147,11 +278,15 @@ def _download_survey(survey_id: str, token: str) -> dict:
         return dict()
 
 
-def extract_dataframes_from_raw_survey(raw_survey: dict) -> pd.DataFrame:
+def extract_dataframes_from_raw_survey(raw_survey: dict, columns: ColumnsSelection | None = None) -> pd.DataFrame:
     """
     Extracts the survey dataframes from the raw survey data (json).
 
     :param raw_survey: The raw survey data as a dictionary.
+    :param columns: The survey response fields to keep, as a glob pattern (e.g., 'q*'), a regular expression
+        (either compiled, or a string prefixed with 're:', e.g., 're:^q[0-9]+$') or a list of these. Fields are
+        selected while the responses are flattened, so unselected fields are never copied into the DataFrame. The
+        response metadata (e.g., sessionToken) is always kept. If None, all fields are kept.
     :return: pd.DataFrame: The extracted survey data as a DataFrame.
     """
     _meta_data = pd.DataFrame(raw_survey['survey_responses'])
@@ -163,12 +298,132 @@ def extract_dataframes_from_raw_survey(raw_survey: dict) -> pd.DataFrame:
 
         _meta_data[COLUMN_NAME_SURVEY_RESPONSE] = [dict() for _ in range(len(_meta_data))]
 
-    _responses = pd.DataFrame(_meta_data[COLUMN_NAME_SURVEY_RESPONSE].values.tolist())
+    _responses = _meta_data[COLUMN_NAME_SURVEY_RESPONSE].values.tolist()
+    if columns is not None:
+        _responses = _project_responses(_responses, columns)
+    _responses = pd.DataFrame(_responses)
     _meta_data = _meta_data.drop(COLUMN_NAME_SURVEY_RESPONSE, axis=1)
     df = pd.concat([_meta_data, _responses], axis=1)
     df[COLUMN_NAME_SURVEY_NAME] = raw_survey['survey_data'][COLUMN_NAME_SURVEY_NAME]
     return df.loc[:, ~df.columns.duplicated()]
 
+def _long_format_from_raw_survey(raw_survey: dict, survey_id: str,
+                                 columns: ColumnsSelection | None = None) -> pd.DataFrame:
+    """
+    Convert the raw survey data (json) into the long (response, item, value) layout.
+
+    Rows are built from the `surveyResponse` of each response, so only answered items are included, and values
+    are kept as they were received. The response metadata is not included as items. Responses are identified by
+    their session token, or by their row number if they have no session token. Images are not included.
+
+    :param raw_survey (dict): The raw survey data as a dictionary.
+    :param survey_id (str): The survey id.
+    :param columns: The survey response fields to keep (see `extract_dataframes_from_raw_survey`). If None, all
+        fields are kept.
+    :return: pd.DataFrame: The survey data with the columns listed in `DATASET_COLUMNS`.
+    """
+    responses = raw_survey['survey_responses']
+    answers = [r.get(COLUMN_NAME_SURVEY_RESPONSE) or dict() for r in responses]
+    if columns is not None:
+        answers = _project_responses(answers, columns)
+
+    response_ids, items, values = [], [], []
+    for n, (response, answer) in enumerate(zip(responses, answers)):
+        response_id = response.get(COLUMN_NAME_SESSION_TOKEN, n)
+        for item, value in answer.items():
+            if value is None or (isinstance(value, str) and value.startswith('data:image')):
+                continue
+            response_ids.append(response_id)
+            items.append(item)
+            values.append(value)
+
+    return pd.DataFrame({
+        COLUMN_NAME_SURVEY_ID: survey_id,
+        COLUMN_NAME_SURVEY_NAME: raw_survey['survey_data'][COLUMN_NAME_SURVEY_NAME],
+        'response': pd.Series(response_ids, dtype=object),
+        'item': pd.Series(items, dtype=object),
+        'value': pd.Series(values, dtype=object),
+    }, columns=DATASET_COLUMNS)
+
+
+def _save_dataset_partition(df: pd.DataFrame, survey_id: str,
+                            dataset_path: typing.Union[str, pathlib.Path]) -> None:
+    """
+    Save the long-format data of a single survey as a partition of the dataset, replacing any
+    previous partition of the same survey.
+
+    :param df (pd.DataFrame): The survey data in long format.
+    :param survey_id (str): The survey id.
+    :param dataset_path (str, pathlib.Path): The dataset directory.
+    :return: None
+    """
+    pth = os.path.join(dataset_path, f'{COLUMN_NAME_SURVEY_ID}={survey_id}')
+    os.makedirs(pth, exist_ok=True)
+    with file_utils.atomic_output_path(os.path.join(pth, DATASET_PARTITION_FNAME)) as tmp_pth:
+        df.to_csv(tmp_pth, encoding='utf-8', index=False)
+
+
+def _compile_columns_selection(columns: ColumnsSelection) -> typing.List[re.Pattern]:
+    """
+    Compile a columns selection into a list of regular expressions. A field is selected if any of them matches
+    (using `search`) the field name.
+
+    :param columns: A glob pattern, a regular expression (compiled, or a string prefixed with `COLUMNS_REGEX_PREFIX`)
+        or a list of these.
+    :return: list: The compiled regular expressions.
+    """
+    if isinstance(columns, (str, re.Pattern)):
+        columns = [columns]
+
+    patterns = []
+    for c in columns:
+        if isinstance(c, re.Pattern):
+            patterns.append(c)
+        elif c.startswith(COLUMNS_REGEX_PREFIX):
+            patterns.append(re.compile(c[len(COLUMNS_REGEX_PREFIX):]))
+        else:
+            # Globs should match the whole field name.
+            patterns.append(re.compile('^' + fnmatch.translate(c)))
+
+    return patterns
+
+
+def _columns_selection_to_json(columns: ColumnsSelection | None) -> typing.List[str] | None:
+    """
+    Convert a columns selection into a JSON serializable list, to record it in the job journal.
+
+    :param columns: The columns selection (see `extract_dataframes_from_raw_survey`).
+    :return: list: The selection as strings, where compiled regular expressions are represented by their repr.
+    """
+    if columns is None:
+        return None
+
+    if isinstance(columns, (str, re.Pattern)):
+        columns = [columns]
+
+    return [c if isinstance(c, str) else repr(c) for c in columns]
+
+
+def _project_responses(responses: typing.List[dict], columns: ColumnsSelection) -> typing.List[dict]:
+    """
+    Keep only the selected fields of each survey response.
+
+    :param responses: The survey responses, as a list of dictionaries.
+    :param columns: The fields to keep (see `extract_dataframes_from_raw_survey`).
+    :return: list: The survey responses, containing only the selected fields.
+    """
+    patterns = _compile_columns_selection(columns)
+    # Responses mostly share the same fields, so each field is only matched once.
+    is_selected = {}
+
+    def _select(field):
+        if field not in is_selected:
+            is_selected[field] = any(p.search(field) for p in patterns)
+        return is_selected[field]
+
+    return [{k: v for k, v in response.items() if _select(k)} for response in responses]
+
+
 def _save_csv(df: pd.DataFrame, survey_name: str,
               root: typing.Union[str, pathlib.Path] = './pavlovia-surveys-output') -> None:
     """"
@@ -181,4 +436,5 @@ def _save_csv(df: pd.DataFrame, survey_name: str,
     """
     pth = os.path.abspath(root)
     os.makedirs(pth, exist_ok=True)
-    df.to_csv(os.path.join(pth, f'{survey_name}.csv'), encoding='utf-8-sig', index=False)
+    with file_utils.atomic_output_path(os.path.join(pth, f'{survey_name}.csv')) as tmp_pth:
+        df.to_csv(tmp_pth, encoding='utf-8-sig', index=False)
@@ -93,7 +93,16 @@ def list_surveys(user, access_rights='both'):
               multiple=False,
               type=str)  # click.Tuple([str, typing.List[str]]))
 @click.option('path', '--path', help='Path to save the surveys.', default='.')
-def get_surveys(user, surveys, path):
+@click.option('--combined', is_flag=True, default=False,
+              help='Save all surveys as a single long-format dataset, partitioned by survey id.')
+@click.option('--image-archive', default=None, type=click.Choice(['zip', 'tar']),
+              help='Save the images of each survey into a single archive, rather than a file per image.')
+@click.option('--resume', is_flag=True, default=False,
+              help='Resume an interrupted download, skipping surveys which were already saved.')
+@click.option('--columns', '-c', multiple=True, type=str,
+              help='Survey response field to keep, as a glob pattern (e.g., "q*"), or a regular expression '
+                   'prefixed with "re:". Can be passed multiple times. If not provided, all fields are kept.')
+def get_surveys(user, surveys, path, combined=False, image_archive=None, resume=False, columns=()):
     """Get all available surveys for a user.
 
     The returned value is a dictionary with the survey id as the key and the survey name as the value.
@@ -102,18 +111,36 @@ def get_surveys(user, surveys, path):
     param user: Full pavlovia username (email).
     param surveys: Single survey id or a list of survey ids, separated by a colon (:) on Linux and Mac, and a
         semicolon (;) on Windows. If not provided, all surveys will be returned.
+    param combined: If set, all surveys are saved as a single long-format dataset (see
+        `download_surveys_as_dataset`), rather than a directory per survey. Cannot be used with `--resume` or
+        `--image-archive`.
+    param image_archive: Either 'zip' or 'tar'. If provided, the images of each survey are saved into a single
+        archive, along with an index of the archived images.
+    param resume: If set, surveys which were completed by a previous run (according to the job journal under
+        the path) are skipped, and only incomplete surveys are downloaded again.
+    param columns: Survey response fields to keep, as glob patterns or regular expressions prefixed with "re:".
 
     return: dict: A dictionary with the survey id as the key and the survey name as the value.
 
     exmple:
     >>> survey-utils get-surveys foo --surveys 12-13 : 14-15 --path /home/user/surveys
+    >>> survey-utils get-surveys foo --surveys 12-13 --columns "q*" --columns "re:^age$"
     """
+    if combined and (resume or image_archive is not None):
+        raise click.UsageError('--combined cannot be used with --resume or --image-archive.')
+
     token = auth.load_token_for_user(user)
 
     if isinstance(surveys, str):
         surveys = surveys.split(':' if os.name != 'nt' else ';')
 
-    click.echo(survey_utils.download_surveys(token, surveys, path))
+    columns = list(columns) if columns else None
+
+    if combined:
+        click.echo(survey_utils.download_surveys_as_dataset(token, surveys, path, columns=columns))
+    else:
+        click.echo(survey_utils.download_surveys(token, surveys, path, image_archive=image_archive,
+                                                 resume=resume, columns=columns))
 
 
 def collect_pavlovia_login_details() -> typing.Tuple:
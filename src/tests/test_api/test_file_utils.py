@@ -1,10 +1,29 @@
+import base64
+import os
+import subprocess
+import sys
+import tarfile
+import textwrap
+import tempfile
 import unittest
+import unittest.mock as mock
+import zipfile
 
 import pandas as pd
 
 from pavlovia_survey_utils.api import file_utils
 
 
+def _list_zip_members(pth):
+    with zipfile.ZipFile(pth) as a:
+        return a.namelist()
+
+
+def _list_tar_members(pth):
+    with tarfile.open(pth) as a:
+        return a.getnames()
+
+
 class TestFileUtils(unittest.TestCase):
 
     def test_find_image_columns(self):
@@ -28,6 +47,125 @@ class TestFileUtils(unittest.TestCase):
     def test_save_image_columns(self):
         pass
 
+    def test_save_image_columns_to_archive(self):
+        encoded = base64.b64encode(b'not really a png').decode()
+        df = pd.DataFrame({
+            'sessionToken': ['a', 'b'],
+            'signature': [f'data:image/png;base64,{encoded}'] * 2,
+        })
+
+        for archive_format, list_members in [('zip', _list_zip_members), ('tar', _list_tar_members)]:
+            with tempfile.TemporaryDirectory() as root:
+                file_utils.save_image_columns(df.iloc[:1], 'survey', root=root, archive_format=archive_format)
+                archive_path = os.path.join(root, 'pavlovia-survey-utils', 'survey', f'images.{archive_format}')
+                self.assertEqual(list_members(archive_path), ['signature/a.png'])
+
+                # A later run appends the new images only
+                file_utils.save_image_columns_to_archive(df, 'survey', archive_format, root)
+                self.assertEqual(list_members(archive_path), ['signature/a.png', 'signature/b.png'])
+
+                index = pd.read_csv(os.path.join(os.path.dirname(archive_path), 'images.csv'))
+                self.assertEqual(index.values.tolist(), [['a', 'signature', 'signature/a.png'],
+                                                         ['b', 'signature', 'signature/b.png']])
+
+        with self.assertRaises(ValueError):
+            file_utils.save_image_columns_to_archive(df, 'survey', 'rar')
+
+    def test_save_image_columns_to_archive_failure(self):
+        encoded = base64.b64encode(b'not really a png').decode()
+        df = pd.DataFrame({
+            'sessionToken': ['a', 'b', 'c'],
+            'signature': [f'data:image/png;base64,{encoded}'] * 3,
+        })
+        read_base64_image_str = file_utils.read_base64_image_str
+
+        for archive_format in file_utils.IMAGE_ARCHIVE_FORMATS:
+            with tempfile.TemporaryDirectory() as root:
+                pth = os.path.join(root, 'pavlovia-survey-utils', 'survey')
+                archive_path = os.path.join(pth, f'images.{archive_format}')
+                index_path = os.path.join(pth, 'images.csv')
+
+                file_utils.save_image_columns_to_archive(df.iloc[:1], 'survey', archive_format, root)
+                with open(archive_path, 'rb') as f, open(index_path, 'rb') as g:
+                    archive_before, index_before = f.read(), g.read()
+
+                # Fail after one new image was appended
+                calls = []
+
+                def _read_then_fail(image_str):
+                    calls.append(image_str)
+                    if len(calls) == 3:
+                        raise KeyboardInterrupt
+                    return read_base64_image_str(image_str)
+
+                with mock.patch.object(file_utils, 'read_base64_image_str', side_effect=_read_then_fail):
+                    with self.assertRaises(KeyboardInterrupt):
+                        file_utils.save_image_columns_to_archive(df, 'survey', archive_format, root)
+
+                with open(archive_path, 'rb') as f, open(index_path, 'rb') as g:
+                    self.assertEqual(f.read(), archive_before)
+                    self.assertEqual(g.read(), index_before)
+                self.assertEqual(sorted(os.listdir(pth)), ['images.csv', f'images.{archive_format}'])
+
+                # The next run appends the missing images
+                file_utils.save_image_columns_to_archive(df, 'survey', archive_format, root)
+                with (zipfile.ZipFile(archive_path) if archive_format == 'zip' else tarfile.open(archive_path)) as a:
+                    self.assertEqual(a.namelist() if archive_format == 'zip' else a.getnames(),
+                                     ['signature/a.png', 'signature/b.png', 'signature/c.png'])
+                self.assertEqual(pd.read_csv(index_path)['member'].tolist(),
+                                 ['signature/a.png', 'signature/b.png', 'signature/c.png'])
+
+    def test_save_image_columns_to_archive_killed(self):
+        # Large images, so the killed run has written past the old archive metadata.
+        script = textwrap.dedent("""
+            import base64, os, sys
+            import pandas as pd
+            from pavlovia_survey_utils.api import file_utils
+
+            root, archive_format, n_images, kill_after = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+            encoded = base64.b64encode(os.urandom(2 ** 16)).decode()
+            df = pd.DataFrame({'sessionToken': [f's{i}' for i in range(n_images)],
+                               'sig': [f'data:image/png;base64,{encoded}'] * n_images})
+
+            read_base64_image_str = file_utils.read_base64_image_str
+            calls = []
+
+            def _read_then_kill(image_str):
+                calls.append(image_str)
+                if len(calls) > kill_after:
+                    os._exit(9)
+                return read_base64_image_str(image_str)
+
+            file_utils.read_base64_image_str = _read_then_kill
+            file_utils.save_image_columns_to_archive(df, 'survey', archive_format, root)
+        """)
+        env = {**os.environ, 'PYTHONPATH': os.path.dirname(os.path.dirname(os.path.abspath(file_utils.__file__)))}
+
+        def run(root, archive_format, n_images, kill_after):
+            return subprocess.run([sys.executable, '-c', script, root, archive_format, str(n_images),
+                                   str(kill_after)], env=env).returncode
+
+        for archive_format in file_utils.IMAGE_ARCHIVE_FORMATS:
+            with tempfile.TemporaryDirectory() as root:
+                archive_path = os.path.join(root, 'pavlovia-survey-utils', 'survey', f'images.{archive_format}')
+
+                self.assertEqual(run(root, archive_format, 3, 3), 0)
+                # Killed after appending two of the three new images
+                self.assertEqual(run(root, archive_format, 6, 5), 9)
+                self.assertEqual(run(root, archive_format, 6, 6), 0)
+
+                expected = [f'sig/s{i}.png' for i in range(6)]
+                if archive_format == 'zip':
+                    with zipfile.ZipFile(archive_path) as a:
+                        self.assertEqual(a.namelist(), expected)
+                        self.assertIsNone(a.testzip())
+                else:
+                    with tarfile.open(archive_path) as a:
+                        self.assertEqual(a.getnames(), expected)
+                self.assertEqual(pd.read_csv(os.path.join(os.path.dirname(archive_path), 'images.csv'))['member']
+                                 .tolist(), expected)
+                self.assertFalse(os.path.exists(f'{archive_path}.rollback'))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+
+from pavlovia_survey_utils.api import journal
+
+
+class TestJournal(unittest.TestCase):
+
+    def test_mark_stage_complete(self):
+        with tempfile.TemporaryDirectory() as root:
+            self.assertEqual(journal.load_journal(root), {})
+
+            job_journal = {}
+            journal.mark_stage_complete(job_journal, root, 'id_1', journal.STAGE_FETCHED)
+            self.assertEqual(journal.load_journal(root), {
+                'id_1': {journal.OPTIONS_KEY_NAME: None, journal.STAGES_KEY_NAME: [journal.STAGE_FETCHED]}})
+            self.assertFalse(os.path.exists(journal.get_journal_path(root) + '.tmp'))
+
+            self.assertTrue(journal.is_stage_complete(job_journal, 'id_1', journal.STAGE_FETCHED))
+            self.assertFalse(journal.is_survey_complete(job_journal, 'id_1'))
+
+            for stage in journal.STAGES:
+                journal.mark_stage_complete(job_journal, root, 'id_1', stage)
+
+            self.assertTrue(journal.is_survey_complete(journal.load_journal(root), 'id_1'))
+            self.assertEqual(journal.get_incomplete_surveys(job_journal, ['id_1', 'id_2']), ['id_2'])
+
+            with self.assertRaises(ValueError):
+                journal.mark_stage_complete(job_journal, root, 'id_1', 'downloaded')
+
+    def test_reset_survey(self):
+        job_journal = {}
+        journal.reset_survey(job_journal, 'id_1', {'image_archive': 'zip'})
+        for stage in journal.STAGES:
+            journal.mark_stage_complete(job_journal, tempfile.gettempdir(), 'id_1', stage)
+
+        self.assertTrue(journal.has_same_options(job_journal, 'id_1', {'image_archive': 'zip'}))
+        self.assertEqual(journal.get_incomplete_surveys(job_journal, ['id_1'], {'image_archive': 'zip'}), [])
+        self.assertEqual(journal.get_incomplete_surveys(job_journal, ['id_1'], {'image_archive': 'tar'}), ['id_1'])
+
+        journal.reset_survey(job_journal, 'id_1', {'image_archive': 'tar'})
+        self.assertFalse(journal.is_stage_complete(job_journal, 'id_1', journal.STAGE_FETCHED))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+import os
+import re
+import tempfile
+import unittest
+import unittest.mock as mock
+
+import pandas as pd
+
+from pavlovia_survey_utils.api import journal, survey_utils
+
+mock_survey_1 = {
+    'survey_data': {'surveyName': 'survey_1'},
+    'survey_responses': [
+        {'sessionToken': 'a', 'surveyResponse': {'q1': 1, 'q2': 'x'}},
+        {'sessionToken': 'b', 'surveyResponse': {'q1': 2, 'q2': 'y'}},
+    ]
+}
+
+mock_survey_2 = {
+    'survey_data': {'surveyName': 'survey_2'},
+    'survey_responses': [
+        {'sessionToken': 'c', 'surveyResponse': {'q3': 'z', 'signature': 'data:image/png;base64,YWJj'}},
+    ]
+}
+
+
+class TestSurveyUtils(unittest.TestCase):
+
+    def test_long_format_from_raw_survey(self):
+        long_df = survey_utils._long_format_from_raw_survey(mock_survey_1, 'id_1')
+
+        self.assertEqual(long_df.columns.tolist(), survey_utils.DATASET_COLUMNS)
+        self.assertEqual(len(long_df), 4)  # 2 responses x (q1, q2)
+        self.assertNotIn('sessionToken', long_df['item'].tolist())
+        self.assertEqual(
+            long_df.loc[(long_df['response'] == 'b') & (long_df['item'] == 'q2'), 'value'].tolist(), ['y'])
+        self.assertTrue((long_df['surveyName'] == 'survey_1').all())
+        self.assertTrue((long_df['surveyId'] == 'id_1').all())
+
+        # Column selection
+        long_df = survey_utils._long_format_from_raw_survey(mock_survey_1, 'id_1', columns='q1')
+        self.assertEqual(long_df['item'].tolist(), ['q1', 'q1'])
+
+    def test_long_format_from_raw_survey_reserved_names(self):
+        raw_survey = {
+            'survey_data': {'surveyName': 'survey_1'},
+            'survey_responses': [
+                {'sessionToken': 'a', 'surveyResponse': {'response': 'r_a', 'item': 'i_a', 'value': 'v_a'}},
+                {'sessionToken': 'b', 'surveyResponse': {'response': 'r_b', 'item': 'i_b', 'value': 'v_b'}},
+            ]
+        }
+        long_df = survey_utils._long_format_from_raw_survey(raw_survey, 'id_1')
+
+        self.assertEqual(long_df.columns.tolist(), survey_utils.DATASET_COLUMNS)
+        self.assertEqual(long_df[['response', 'item', 'value']].values.tolist(), [
+            ['a', 'response', 'r_a'], ['a', 'item', 'i_a'], ['a', 'value', 'v_a'],
+            ['b', 'response', 'r_b'], ['b', 'item', 'i_b'], ['b', 'value', 'v_b'],
+        ])
+
+    def test_long_format_from_raw_survey_sparse(self):
+        raw_survey = {
+            'survey_data': {'surveyName': 'survey_1'},
+            'survey_responses': [
+                # Response metadata (other than the session token) is not included as items
+                {'sessionToken': 'a', 'surveyId': 'id_1', 'surveyResponse': {'q1': 1}},
+                {'sessionToken': 'b', 'surveyId': 'id_1', 'surveyResponse': {'q2': 'x'}},
+            ]
+        }
+
+        with tempfile.TemporaryDirectory() as root, \
+                mock.patch.object(survey_utils, '_download_survey', return_value=raw_survey):
+            dataset_path = survey_utils.download_surveys_as_dataset('token', 'id_1', root)
+
+            with open(os.path.join(dataset_path, 'surveyId=id_1', 'responses.csv'), encoding='utf-8') as f:
+                # Only answered items, with their original values
+                self.assertEqual(f.read().splitlines(), [
+                    'surveyId,surveyName,response,item,value',
+                    'id_1,survey_1,a,q1,1',
+                    'id_1,survey_1,b,q2,x',
+                ])
+
+    def test_extract_dataframes_from_raw_survey_columns(self):
+        def extract_columns(columns):
+            return survey_utils.extract_dataframes_from_raw_survey(mock_survey_1, columns=columns).columns.tolist()
+
+        self.assertEqual(extract_columns(None), ['sessionToken', 'q1', 'q2', 'surveyName'])
+        # Glob patterns match the whole field name
+        self.assertEqual(extract_columns('q1'), ['sessionToken', 'q1', 'surveyName'])
+        self.assertEqual(extract_columns('q*'), ['sessionToken', 'q1', 'q2', 'surveyName'])
+        self.assertEqual(extract_columns('1'), ['sessionToken', 'surveyName'])
+        # Regular expressions
+        self.assertEqual(extract_columns('re:2$'), ['sessionToken', 'q2', 'surveyName'])
+        self.assertEqual(extract_columns(re.compile('Q1', re.IGNORECASE)), ['sessionToken', 'q1', 'surveyName'])
+        self.assertEqual(extract_columns(['q1', 're:^q2$']), ['sessionToken', 'q1', 'q2', 'surveyName'])
+
+    def test_download_surveys_as_dataset(self):
+        raw_surveys = {'id_1': mock_survey_1, 'id_2': mock_survey_2}
+
+        with tempfile.TemporaryDirectory() as root, \
+                mock.patch.object(survey_utils, '_download_survey', side_effect=lambda _id, _: raw_surveys[_id]):
+            dataset_path = survey_utils.download_surveys_as_dataset('token', ['id_1', 'id_2'], root)
+
+            self.assertEqual(sorted(os.listdir(dataset_path)), ['surveyId=id_1', 'surveyId=id_2'])
+
+            df = pd.concat([pd.read_csv(os.path.join(dataset_path, f'surveyId={_id}', 'responses.csv'))
+                            for _id in raw_surveys])
+            self.assertEqual(df.columns.tolist(), survey_utils.DATASET_COLUMNS)
+            # Image columns are not part of the dataset
+            self.assertNotIn('signature', df['item'].tolist())
+
+    def test_download_surveys_resume(self):
+        raw_surveys = {'id_1': mock_survey_1, 'id_2': mock_survey_2}
+
+        with tempfile.TemporaryDirectory() as root, \
+                mock.patch.object(survey_utils, '_download_survey',
+                                  side_effect=lambda _id, _: raw_surveys[_id]) as mock_download:
+            # Interrupt the download while saving the images of the second survey
+            with mock.patch.object(survey_utils.file_utils, 'save_image_columns', side_effect=KeyboardInterrupt):
+                with self.assertRaises(KeyboardInterrupt):
+                    survey_utils.download_surveys('token', ['id_1', 'id_2'], root)
+
+            job_journal = journal.load_journal(root)
+            self.assertTrue(journal.is_survey_complete(job_journal, 'id_1'))
+            self.assertTrue(journal.is_stage_complete(job_journal, 'id_2', journal.STAGE_CSV_WRITTEN))
+            self.assertFalse(journal.is_stage_complete(job_journal, 'id_2', journal.STAGE_IMAGES_WRITTEN))
+
+            mock_download.reset_mock()
+            survey_utils.download_surveys('token', ['id_1', 'id_2'], root, resume=True)
+
+            # Only the incomplete survey is downloaded again
+            mock_download.assert_called_once_with('id_2', 'token')
+            self.assertTrue(journal.is_survey_complete(journal.load_journal(root), 'id_2'))
+            self.assertTrue(os.path.exists(os.path.join(root, 'pavlovia-survey-utils', 'survey_2', 'images',
+                                                        'signature')))
+            self.assertEqual(sorted(f for f in os.listdir(root) if f.endswith('.csv')),
+                             ['survey_1.csv', 'survey_2.csv'])
+
+    def test_download_surveys_failed_rerun(self):
+        raw_surveys = {'id_1': mock_survey_1}
+
+        with tempfile.TemporaryDirectory() as root, \
+                mock.patch.object(survey_utils, '_download_survey',
+                                  side_effect=lambda _id, _: raw_surveys[_id]) as mock_download:
+            survey_utils.download_surveys('token', ['id_1'], root)
+            self.assertTrue(journal.is_survey_complete(journal.load_journal(root), 'id_1'))
+
+            # A new (non-resumed) run which fails to download the survey
+            mock_download.side_effect = lambda _id, _: dict()
+            survey_utils.download_surveys('token', ['id_1'], root)
+            self.assertFalse(journal.is_survey_complete(journal.load_journal(root), 'id_1'))
+
+            mock_download.side_effect = lambda _id, _: raw_surveys[_id]
+            mock_download.reset_mock()
+            survey_utils.download_surveys('token', ['id_1'], root, resume=True)
+            mock_download.assert_called_once_with('id_1', 'token')
+
+    def test_download_surveys_resume_different_options(self):
+        raw_surveys = {'id_2': mock_survey_2}
+
+        with tempfile.TemporaryDirectory() as root, \
+                mock.patch.object(survey_utils, '_download_survey',
+                                  side_effect=lambda _id, _: raw_surveys[_id]) as mock_download:
+            survey_utils.download_surveys('token', ['id_2'], root)
+
+            mock_download.reset_mock()
+            survey_utils.download_surveys('token', ['id_2'], root, resume=True)
+            mock_download.assert_not_called()
+
+            with self.assertWarns(UserWarning):
+                survey_utils.download_surveys('token', ['id_2'], root, resume=True, image_archive='zip')
+            mock_download.assert_called_once_with('id_2', 'token')
+            self.assertTrue(os.path.exists(os.path.join(root, 'pavlovia-survey-utils', 'survey_2', 'images.zip')))
+
+            mock_download.reset_mock()
+            with self.assertWarns(UserWarning):
+                survey_utils.download_surveys('token', ['id_2'], root, resume=True, image_archive='zip',
+                                              columns=[re.compile('Q3', re.IGNORECASE)])
+            mock_download.assert_called_once_with('id_2', 'token')
+
+    def test_download_surveys_invalid_image_archive(self):
+        with tempfile.TemporaryDirectory() as root, \
+                mock.patch.object(survey_utils, '_download_survey') as mock_download:
+            with self.assertRaises(ValueError):
+                survey_utils.download_surveys('token', ['id_1'], root, image_archive='rar')
+
+            # Nothing is fetched or written
+            mock_download.assert_not_called()
+            self.assertEqual(os.listdir(root), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+import unittest.mock as mock
+
+from click.testing import CliRunner
+
+from pavlovia_survey_utils.cli import commands
+
+
+class TestCommands(unittest.TestCase):
+
+    def test_get_surveys_combined_usage_error(self):
+        runner = CliRunner()
+
+        with mock.patch.object(commands.survey_utils, 'download_surveys_as_dataset') as mock_download:
+            for args in (['--resume'], ['--image-archive', 'zip']):
+                result = runner.invoke(commands.get_surveys, ['mock_user', '--combined'] + args)
+                self.assertEqual(result.exit_code, 2)
+                self.assertIn('--combined cannot be used', result.output)
+
+            mock_download.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()